@@ -0,0 +1,743 @@
+#!/usr/bin/env python3
+"""
+Test suite for the web dashboard (webapp/app.py)
+
+This test suite covers:
+- Keyword scanning with the pyahocorasick and regex backends
+- Splitting deploy.py output read from a pipe
+- Incremental log polling across run boundaries
+- Status JSON encoding and the /api/status endpoint
+- Stage and task tracking from deploy and destroy output
+- Role detection from terraform.tfvars
+- Stopping a run, including the processes deploy.py started
+- Proxmox client caching
+"""
+
+import unittest
+from unittest.mock import patch
+from pathlib import Path
+import sys
+import os
+import json
+import shutil
+import tempfile
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "webapp")
+)
+import app as webapp  # noqa: E402
+
+
+def read_all_lines(data):
+    """Write data to a pipe, close it and collect every yielded line"""
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, data)
+    os.close(write_fd)
+    try:
+        return [
+            line
+            for block in webapp._iter_output_blocks(read_fd)
+            for line in block
+        ]
+    finally:
+        os.close(read_fd)
+
+
+class KeywordScannerTests:
+    """Behaviour shared by both KeywordScanner backends"""
+
+    use_ahocorasick = True
+
+    def make_scanner(self, entries):
+        with patch.object(webapp, "HAS_AHOCORASICK", self.use_ahocorasick):
+            return webapp.KeywordScanner(entries)
+
+    def test_scan_reports_start_offsets(self):
+        """Test that each hit carries the keyword's start index"""
+        scanner = self.make_scanner([("apply", "a"), ("plan", "p")])
+        hits = scanner.scan("plan then apply")
+        self.assertEqual(sorted(hits), [(0, "p"), (10, "a")])
+
+    def test_scan_no_match(self):
+        """Test that a line without keywords yields no hits"""
+        scanner = self.make_scanner([("apply", "a")])
+        self.assertEqual(scanner.scan("nothing here"), [])
+
+    def test_scan_overlapping_keywords(self):
+        """Test keywords that overlap inside the line"""
+        scanner = self.make_scanner([("abc", 1), ("bcd", 2)])
+        self.assertEqual(sorted(scanner.scan("xabcd")), [(1, 1), (2, 2)])
+
+    def test_scan_prefix_keywords(self):
+        """Test a keyword that is a prefix of another"""
+        scanner = self.make_scanner(
+            [("Destroy", "short"), ("Destroying", "long")]
+        )
+        self.assertEqual(
+            sorted(scanner.scan("x: Destroying...")),
+            [(3, "long"), (3, "short")],
+        )
+
+    def test_scan_repeated_keyword_payloads(self):
+        """Test that every payload of a repeated keyword is reported"""
+        scanner = self.make_scanner([("TASK [", 1), ("TASK [", 2)])
+        self.assertEqual(sorted(scanner.scan("TASK [x]")), [(0, 1), (0, 2)])
+
+    def test_scan_repeated_occurrences(self):
+        """Test that every occurrence of a keyword is reported"""
+        scanner = self.make_scanner([("ok", "k")])
+        self.assertEqual(sorted(scanner.scan("ok ok")), [(0, "k"), (3, "k")])
+
+
+@unittest.skipUnless(webapp.HAS_AHOCORASICK, "pyahocorasick not installed")
+class TestKeywordScannerAhocorasick(KeywordScannerTests, unittest.TestCase):
+    """Test KeywordScanner backed by pyahocorasick"""
+
+    use_ahocorasick = True
+
+
+class TestKeywordScannerRegex(KeywordScannerTests, unittest.TestCase):
+    """Test KeywordScanner backed by the regex fallback"""
+
+    use_ahocorasick = False
+
+
+class TestOutputBlocks(unittest.TestCase):
+    """Test reading deploy.py output from a pipe"""
+
+    def test_line_endings(self):
+        """Test LF, CRLF and bare CR line endings"""
+        lines = read_all_lines(b"one\ntwo\r\nthree\rfour\n")
+        self.assertEqual(lines, ["one", "two", "three", "four"])
+
+    def test_blank_lines_dropped(self):
+        """Test that blank and whitespace-only lines are skipped"""
+        self.assertEqual(read_all_lines(b"\n  \r\n a \n\n"), ["a"])
+
+    def test_trailing_line_without_newline(self):
+        """Test that the unterminated last line is yielded at EOF"""
+        self.assertEqual(read_all_lines(b"first\nlast"), ["first", "last"])
+
+    def test_partial_tail_across_reads(self):
+        """Test that a line split across reads is joined"""
+        read_fd, write_fd = os.pipe()
+        try:
+            os.write(write_fd, b"one\npar")
+            blocks = webapp._iter_output_blocks(read_fd)
+            self.assertEqual(next(blocks), ["one"])
+            os.write(write_fd, b"tial\n")
+            os.close(write_fd)
+            write_fd = None
+            rest = [line for block in blocks for line in block]
+            self.assertEqual(rest, ["partial"])
+        finally:
+            if write_fd is not None:
+                os.close(write_fd)
+            os.close(read_fd)
+
+    def test_ansi_codes_stripped(self):
+        """Test that ANSI colour codes are removed"""
+        lines = read_all_lines(b"\x1b[0;32mok: [vm1]\x1b[0m\nplain\n")
+        self.assertEqual(lines, ["ok: [vm1]", "plain"])
+
+    def test_invalid_utf8_replaced(self):
+        """Test that undecodable bytes become replacement characters"""
+        lines = read_all_lines(b"caf\xc3\xa9 \xff\n")
+        self.assertEqual(lines, ["café �"])
+
+    def test_wake_fd_calls_on_wake_and_keeps_reading(self):
+        """Test that a readable wake fd calls on_wake, then reads to EOF"""
+        read_fd, write_fd = os.pipe()
+        wake_read, wake_write = os.pipe()
+        wakeups = []
+
+        def on_wake():
+            wakeups.append(True)
+            os.write(write_fd, b"shutting down\n")
+            os.close(write_fd)
+
+        try:
+            os.write(wake_write, b"x")
+            blocks = list(
+                webapp._iter_output_blocks(read_fd, wake_read, on_wake)
+            )
+            self.assertEqual(wakeups, [True])
+            self.assertEqual(blocks, [["shutting down"]])
+        finally:
+            for fd in (read_fd, wake_read, wake_write):
+                os.close(fd)
+
+
+class TestLogPayload(unittest.TestCase):
+    """Test incremental log polling"""
+
+    def setUp(self):
+        self.runner = webapp.DeploymentRunner()
+
+    def test_full_log_without_since(self):
+        """Test that a poll without since returns the whole buffer"""
+        self.runner._append_logs(["a", "b"])
+        payload = self.runner._log_payload(None)
+        self.assertEqual(payload["logs"], ["a", "b"])
+        self.assertEqual(payload["log_seq"], 2)
+        self.assertTrue(payload["logs_complete"])
+
+    def test_incremental_within_run(self):
+        """Test that later polls only return new lines"""
+        self.runner._append_log("a")
+        seq = self.runner._log_payload(None)["log_seq"]
+        self.runner._append_logs(["b", "c"])
+        payload = self.runner._log_payload(seq)
+        self.assertEqual(payload["logs"], ["b", "c"])
+        self.assertFalse(payload["logs_complete"])
+
+    def test_run_boundary_replaces_log(self):
+        """Test that the first polls of a new run replace the old log"""
+        self.runner._append_logs(["run1 a", "run1 b"])
+        seq = self.runner._log_payload(None)["log_seq"]
+
+        self.runner._reset_state()
+        payload = self.runner._log_payload(seq)
+        self.assertEqual(payload["logs"], [])
+        self.assertTrue(payload["logs_complete"])
+
+        self.runner._append_log("run2 line 1")
+        payload = self.runner._log_payload(payload["log_seq"])
+        self.assertEqual(payload["logs"], ["run2 line 1"])
+        self.assertTrue(payload["logs_complete"])
+
+        self.runner._append_log("run2 line 2")
+        payload = self.runner._log_payload(payload["log_seq"])
+        self.assertEqual(payload["logs"], ["run2 line 2"])
+        self.assertFalse(payload["logs_complete"])
+
+    def test_generated_lines_follow_their_trigger(self):
+        """Test that lines added by the parser keep their position"""
+        self.runner._handle_lines(
+            ["Deployment completed successfully", "Summary", "Access"]
+        )
+        self.assertEqual(
+            list(self.runner.logs),
+            [
+                "Deployment completed successfully",
+                "All stages completed.",
+                "Summary",
+                "Access",
+            ],
+        )
+
+    def test_since_older_than_buffer(self):
+        """Test that a since behind the buffered lines returns everything"""
+        self.runner._append_log("a")
+        seq = self.runner._log_payload(None)["log_seq"]
+        lines = [f"line {i}" for i in range(webapp.MAX_LOG_LINES + 5)]
+        self.runner._append_logs(lines)
+        payload = self.runner._log_payload(seq)
+        self.assertEqual(payload["logs"], lines[-webapp.MAX_LOG_LINES :])
+        self.assertTrue(payload["logs_complete"])
+
+
+DEPLOY_LOG = """
+==== INITIAL SETUP AND VALIDATION ====
+Checking prerequisites
+==== TERRAFORM DEPLOYMENT ====
+Initializing the backend
+✓ Configuration valid
+Planning deployment
+✓ Plan created
+[INFO] Creating VM k3s-1
+[INFO] Creating VM k3s-1
+[INFO] Creating VM docker-1
+✓ Infrastructure created successfully
+Running Ansible NAT configuration
+TASK [Gathering Facts]
+TASK [Add NAT rule]
+TASK [Add NAT rule]
+TASK [Add NAT]
+Ansible NAT configuration completed successfully
+Running Ansible VM configuration
+TASK [Update package cache]
+Ansible VM configuration completed successfully
+Running Ansible K3s installation
+TASK [Install K3s]
+""".strip().splitlines()
+
+DESTROY_LOG = """
+Running Ansible NAT rule removal
+TASK [Load inventories]
+Ansible NAT rule removal completed successfully
+Using OpenTofu
+Performing tofu destroy -auto-approve
+module.vm[1]: Destroying... [id=101]
+module.vm[0]: Destroying... [id=100]
+module.vm[0]: Destroying... [id=100]
+module.vm[0]: Destruction complete after 2s
+""".strip().splitlines()
+
+
+class TestStatusJson(unittest.TestCase):
+    """Test the encoded status served by /api/status"""
+
+    def setUp(self):
+        self.runner = webapp.DeploymentRunner()
+        self.runner._append_logs(["a", "b"])
+        patcher = patch.object(webapp, "runner", self.runner)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = webapp.app.test_client()
+
+    def test_matches_snapshot(self):
+        """Test that status_json decodes to status_snapshot"""
+        seq = self.runner.status_snapshot()["log_seq"]
+        self.runner._append_log("c")
+        for since in (None, seq):
+            self.assertEqual(
+                json.loads(self.runner.status_json(since)),
+                self.runner.status_snapshot(since),
+            )
+
+    def test_status_route_without_since(self):
+        """Test that /api/status returns the stages and whole log"""
+        payload = json.loads(self.client.get("/api/status").data)
+        self.assertFalse(payload["running"])
+        self.assertEqual(
+            [stage["id"] for stage in payload["stages"]],
+            [stage["id"] for stage in self.runner.stage_state],
+        )
+        self.assertEqual(payload["logs"], ["a", "b"])
+        self.assertEqual(payload["log_seq"], 2)
+        self.assertTrue(payload["logs_complete"])
+
+    def test_status_route_with_since(self):
+        """Test that /api/status?since= returns only newer lines"""
+        self.runner._append_log("c")
+        response = self.client.get("/api/status?since=2")
+        self.assertEqual(response.mimetype, "application/json")
+        payload = json.loads(response.data)
+        self.assertIn("stages", payload)
+        self.assertEqual(payload["logs"], ["c"])
+        self.assertEqual(payload["log_seq"], 3)
+        self.assertFalse(payload["logs_complete"])
+
+    def test_cached_state_reencoded_after_change(self):
+        """Test that a state change is reflected in the next response"""
+        self.client.get("/api/status")
+        self.runner._start_stage(self.runner.stage_state[0]["id"])
+        payload = json.loads(self.client.get("/api/status").data)
+        self.assertEqual(payload["stages"][0]["status"], "running")
+
+
+class TestStageTracking(unittest.TestCase):
+    """Test stage and task statuses derived from deploy.py output"""
+
+    def start_run(self, mode, lines):
+        runner = webapp.DeploymentRunner()
+        runner.mode = mode
+        runner.role_usage = {"k3s": True, "docker": True}
+        runner._reset_state()
+        runner._running.set()
+        runner._handle_lines(lines)
+        return runner
+
+    def stages(self, runner):
+        return {
+            stage["id"]: stage for stage in runner.status_snapshot()["stages"]
+        }
+
+    def tasks(self, runner, stage_id):
+        return [
+            (task["label"], task["status"])
+            for task in self.stages(runner)[stage_id]["tasks"]
+        ]
+
+    def test_ansible_tasks(self):
+        """Test that each Ansible TASK completes the one before it"""
+        lines = DEPLOY_LOG[: DEPLOY_LOG.index("TASK [Add NAT]") + 1]
+        runner = self.start_run("deploy", lines)
+        tasks = self.tasks(runner, "nat")
+        self.assertEqual(tasks[0], ("Build inventories", "completed"))
+        self.assertTrue(all(status == "pending" for _, status in tasks[1:5]))
+        self.assertEqual(
+            tasks[5:],
+            [
+                ("Gathering Facts", "completed"),
+                ("Add NAT rule", "completed"),
+                ("Add NAT rule (2)", "completed"),
+                ("Add NAT", "running"),
+            ],
+        )
+
+    def test_repeated_task_names_get_exact_label_suffixes(self):
+        """Test that only exact repeats of a task name are suffixed"""
+        runner = self.start_run("deploy", DEPLOY_LOG)
+        labels = [label for label, _ in self.tasks(runner, "nat")]
+        self.assertIn("Add NAT rule (2)", labels)
+        self.assertIn("Add NAT", labels)
+        self.assertNotIn("Add NAT (2)", labels)
+        # A name matching a base task label counts as a repeat of it
+        labels = [label for label, _ in self.tasks(runner, "vm")]
+        self.assertIn("Update package cache (2)", labels)
+
+    def test_terraform_creation_tasks(self):
+        """Test that each created resource becomes its own task"""
+        end = DEPLOY_LOG.index("[INFO] Creating VM docker-1") + 1
+        runner = self.start_run("deploy", DEPLOY_LOG[:end])
+        stage = self.stages(runner)["terraform"]
+        self.assertEqual(stage["status"], "running")
+        self.assertEqual(
+            self.tasks(runner, "terraform"),
+            [
+                ("Initialize & validate", "completed"),
+                ("Create execution plan", "completed"),
+                ("Apply infrastructure", "running"),
+                ("Creating VM k3s-1", "completed"),
+                ("Creating VM k3s-1 (2)", "completed"),
+                ("Creating VM docker-1", "running"),
+            ],
+        )
+
+        runner._handle_lines(["✓ Infrastructure created successfully"])
+        tasks = self.tasks(runner, "terraform")
+        self.assertTrue(all(status == "completed" for _, status in tasks))
+
+    def test_stage_headers_complete_previous_stage(self):
+        """Test that stage markers complete the stage before them"""
+        runner = self.start_run("deploy", DEPLOY_LOG)
+        stages = self.stages(runner)
+        for stage_id in ("setup", "terraform", "nat", "vm"):
+            self.assertEqual(stages[stage_id]["status"], "completed")
+        self.assertEqual(stages["k3s"]["status"], "running")
+        self.assertEqual(runner.current_stage, "k3s")
+
+    def test_destroy_completion_matches_resource_prefix(self):
+        """Test that a destruction completes every task for its resource"""
+        runner = self.start_run("destroy", DESTROY_LOG[:-1])
+        self.assertEqual(
+            self.stages(runner)["destroy_nat"]["status"], "completed"
+        )
+        stage = runner.stage_state[runner._stage_lookup["destroy_tf"]]
+        runner._complete_matching_destroy_task(
+            stage, "module.vm[1]: Destruction complete after 2s"
+        )
+        # Read the stage directly: these calls do not bump the snapshot
+        self.assertEqual(
+            [(task["label"], task["status"]) for task in stage["tasks"]],
+            [
+                ("Select Terraform/OpenTofu", "completed"),
+                ("Destroy VM resources", "running"),
+                ("Destroying module.vm[1]", "completed"),
+                ("Destroying module.vm[0]", "completed"),
+                ("Destroying module.vm[0] (2)", "running"),
+            ],
+        )
+
+        # The repeat's suffixed label still starts with the resource name
+        runner._complete_matching_destroy_task(stage, DESTROY_LOG[-1])
+        self.assertEqual(
+            stage["tasks"][-1],
+            {"label": "Destroying module.vm[0] (2)", "status": "completed"},
+        )
+
+    def test_destroy_complete_finishes_destroy_tasks(self):
+        """Test that the destroy summary completes the Terraform stage"""
+        runner = self.start_run("destroy", DESTROY_LOG)
+        runner._handle_lines(["Destroy complete! Resources: 2 destroyed."])
+        runner._finalize_run(True)
+        stages = self.stages(runner)
+        self.assertEqual(stages["destroy_tf"]["status"], "completed")
+        tasks = self.tasks(runner, "destroy_tf")
+        self.assertEqual(len(tasks), 5)
+        self.assertTrue(all(status == "completed" for _, status in tasks))
+
+    def test_finalize_failure_fails_current_and_skips_rest(self):
+        """Test that a failed run fails the current stage, skips the rest"""
+        runner = self.start_run("deploy", DEPLOY_LOG)
+        runner._finalize_run(False)
+        stages = self.stages(runner)
+        self.assertFalse(runner.running)
+        self.assertIsNone(runner.current_stage)
+
+        self.assertEqual(stages["k3s"]["status"], "failed")
+        self.assertEqual(stages["k3s"]["note"], "Deployment stopped.")
+        tasks = self.tasks(runner, "k3s")
+        self.assertEqual(tasks[0], ("Install K3s binaries", "completed"))
+        self.assertEqual(tasks[-1], ("Install K3s", "failed"))
+        self.assertTrue(all(status == "skipped" for _, status in tasks[1:-1]))
+
+        for stage_id in ("docker", "openfaas"):
+            self.assertEqual(stages[stage_id]["status"], "skipped")
+            self.assertEqual(
+                stages[stage_id]["note"], "Not executed in this run."
+            )
+            self.assertTrue(
+                all(
+                    task["status"] == "skipped"
+                    for task in stages[stage_id]["tasks"]
+                )
+            )
+        self.assertEqual(stages["nat"]["status"], "completed")
+
+
+class TestLogLineLimit(unittest.TestCase):
+    """Test the DEPLOY_UI_LOG_LINES setting"""
+
+    def limit(self, value):
+        with patch.dict(os.environ, {"DEPLOY_UI_LOG_LINES": value}):
+            return webapp._log_line_limit()
+
+    def test_valid_value(self):
+        """Test that a positive integer is used as is"""
+        self.assertEqual(self.limit("50"), 50)
+
+    def test_invalid_values_fall_back(self):
+        """Test that non-integer, zero and negative values use the default"""
+        for value in ("lots", "", "0", "-5"):
+            self.assertEqual(self.limit(value), webapp.DEFAULT_LOG_LINES)
+
+    def test_unset_uses_default(self):
+        """Test the default when the variable is not set"""
+        with patch.dict(os.environ):
+            os.environ.pop("DEPLOY_UI_LOG_LINES", None)
+            self.assertEqual(webapp._log_line_limit(), 200)
+
+
+class TestRoleUsage(unittest.TestCase):
+    """Test role detection from terraform.tfvars"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.tfvars = Path(self.temp_dir) / "terraform.tfvars"
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def usage(self, content):
+        self.tfvars.write_text(content)
+        with patch.object(webapp, "TFVARS_FILE", self.tfvars):
+            return webapp.determine_vm_role_usage()
+
+    def test_default_role(self):
+        """Test that unassigned VMs use default_vm_role"""
+        usage = self.usage('vm_count = 3\ndefault_vm_role = "docker"\n')
+        self.assertEqual(usage, {"k3s": False, "docker": True})
+
+    def test_multiline_map_with_comments(self):
+        """Test a vm_roles block with comments on and between entries"""
+        usage = self.usage(
+            'vm_count = 2 # two\nvm_roles = {\n  "a" = "k3s" // c\n'
+            '  # "b" = "docker"\n}\n'
+        )
+        self.assertEqual(usage, {"k3s": True, "docker": False})
+
+    def test_single_line_map(self):
+        """Test a vm_roles map written on one line"""
+        usage = self.usage('vm_count = 2\nvm_roles = { "a" = "docker" }\n')
+        self.assertEqual(usage, {"k3s": True, "docker": True})
+
+    def test_brace_on_next_line(self):
+        """Test a vm_roles map whose opening brace is on the next line"""
+        usage = self.usage('vm_count = 1\nvm_roles\n{\n"x"="docker"\n}\n')
+        self.assertEqual(usage, {"k3s": False, "docker": True})
+
+    def test_all_vms_assigned(self):
+        """Test that the default role is ignored when every VM has a role"""
+        usage = self.usage(
+            'vm_count = 2\ndefault_vm_role = "k3s"\n'
+            'vm_roles = {\n"a"="docker"\n"b"="docker"\n}\n'
+        )
+        self.assertEqual(usage, {"k3s": False, "docker": True})
+
+    def test_commented_out_settings(self):
+        """Test that commented settings fall back to the defaults"""
+        usage = self.usage('// vm_count = 5\n#default_vm_role = "docker"\n')
+        self.assertEqual(usage, {"k3s": True, "docker": False})
+
+    def test_missing_file(self):
+        """Test the defaults when no tfvars file exists"""
+        missing = Path(self.temp_dir) / "missing.tfvars"
+        with patch.object(webapp, "TFVARS_FILE", missing), patch.object(
+            webapp, "TFVARS_EXAMPLE_FILE", missing
+        ):
+            usage = webapp.determine_vm_role_usage()
+        self.assertEqual(usage, {"k3s": True, "docker": False})
+
+
+class FakeProxmoxAPI:
+    """Stand-in for proxmoxer.ProxmoxAPI recording each login"""
+
+    logins = 0
+    fail = False
+
+    def __init__(self, host, **kwargs):
+        FakeProxmoxAPI.logins += 1
+        self.cluster = self
+
+    @property
+    def resources(self):
+        return self
+
+    def get(self, type):
+        if FakeProxmoxAPI.fail:
+            raise ConnectionError("ticket expired")
+        return [{"vmid": 100}]
+
+
+class TestProxmoxClientCache(unittest.TestCase):
+    """Test reuse and invalidation of Proxmox clients"""
+
+    def setUp(self):
+        FakeProxmoxAPI.logins = 0
+        FakeProxmoxAPI.fail = False
+        webapp._PROXMOX_CLIENT_CACHE.clear()
+        webapp._VM_STATS_CACHE = None
+        patchers = [
+            patch.object(webapp, "ProxmoxAPI", FakeProxmoxAPI, create=True),
+            patch.object(webapp, "HAS_PROXMOXER", True),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(webapp._PROXMOX_CLIENT_CACHE.clear)
+
+    def creds(self, user="root@pam"):
+        return {"url": "https://pve:8006", "user": user, "password": "pw"}
+
+    def test_client_reused(self):
+        """Test that the same credentials reuse one login"""
+        client = webapp.connect_proxmox(self.creds())
+        self.assertIs(webapp.connect_proxmox(self.creds()), client)
+        self.assertEqual(FakeProxmoxAPI.logins, 1)
+
+    def test_only_current_credentials_kept(self):
+        """Test that changing credentials evicts the previous client"""
+        webapp.connect_proxmox(self.creds())
+        webapp.connect_proxmox(self.creds(user="other@pam"))
+        self.assertEqual(len(webapp._PROXMOX_CLIENT_CACHE), 1)
+
+    def test_failed_request_forces_login(self):
+        """Test that a failing client is dropped from the cache"""
+        client = webapp.connect_proxmox(self.creds())
+        FakeProxmoxAPI.fail = True
+        with self.assertRaises(ConnectionError):
+            webapp.get_cluster_vm_stats(client)
+
+        FakeProxmoxAPI.fail = False
+        new_client = webapp.connect_proxmox(self.creds())
+        self.assertIsNot(new_client, client)
+        self.assertEqual(FakeProxmoxAPI.logins, 2)
+        stats = webapp.get_cluster_vm_stats(new_client)
+        self.assertEqual(stats, [{"vmid": 100}])
+
+
+FAKE_DEPLOY_SCRIPT = """
+import subprocess, sys
+child = subprocess.Popen("exec sleep 60", shell=True)
+print(f"child {child.pid}", flush=True)
+child.wait()
+"""
+
+# deploy.py dies on SIGTERM, its child takes a while to shut down
+GRACEFUL_DEPLOY_SCRIPT = """
+import subprocess, sys
+from pathlib import Path
+child_script = Path(__file__).with_name("child.py")
+child = subprocess.Popen([sys.executable, str(child_script)])
+print(f"child {child.pid}", flush=True)
+child.wait()
+"""
+
+GRACEFUL_CHILD_SCRIPT = """
+import signal, sys, time
+
+def shut_down(signum, frame):
+    time.sleep(1)
+    print("child stopped cleanly", flush=True)
+    sys.exit(0)
+
+signal.signal(signal.SIGTERM, shut_down)
+time.sleep(60)
+"""
+
+
+def process_alive(pid):
+    """Return whether pid exists and is not a zombie"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            return stat_file.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+class TestStopRun(unittest.TestCase):
+    """Test stopping a deploy.py run"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.script = Path(self.temp_dir) / "deploy.py"
+        self.script.write_text(FAKE_DEPLOY_SCRIPT)
+        self.runner = webapp.DeploymentRunner()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def wait_for(self, predicate, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                self.fail("Timed out waiting for the runner")
+            time.sleep(0.05)
+
+    def child_pid(self):
+        for line in list(self.runner.logs):
+            if line.startswith("child "):
+                return int(line.split()[1])
+        return None
+
+    def test_stop_without_run(self):
+        """Test that stop() reports when nothing is running"""
+        self.assertFalse(self.runner.stop())
+
+    def test_stop_terminates_child_processes(self):
+        """Test that stopping also ends the processes deploy.py started"""
+        with patch.object(webapp, "DEPLOY_SCRIPT", self.script):
+            self.assertTrue(self.runner.start("deploy"))
+            self.wait_for(lambda: self.child_pid() is not None)
+            child_pid = self.child_pid()
+
+            self.assertTrue(self.runner.stop())
+            self.wait_for(lambda: not self.runner.running)
+
+            self.assertFalse(process_alive(child_pid))
+            self.assertNotEqual(self.runner.return_code, 0)
+            self.assertIn(
+                "Stop requested, terminating deploy.py and its child "
+                "processes.",
+                self.runner.logs,
+            )
+
+    def test_stop_waits_for_graceful_shutdown(self):
+        """Test that a run stays active until its children exit"""
+        self.script.write_text(GRACEFUL_DEPLOY_SCRIPT)
+        child_script = Path(self.temp_dir) / "child.py"
+        child_script.write_text(GRACEFUL_CHILD_SCRIPT)
+        with patch.object(webapp, "DEPLOY_SCRIPT", self.script):
+            self.assertTrue(self.runner.start("deploy"))
+            self.wait_for(lambda: self.child_pid() is not None)
+            # Let the child install its SIGTERM handler
+            time.sleep(0.5)
+
+            self.assertTrue(self.runner.stop())
+            time.sleep(0.5)
+            self.assertTrue(self.runner.running)
+            self.wait_for(lambda: not self.runner.running)
+
+            self.assertIn("child stopped cleanly", self.runner.logs)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -8,12 +8,20 @@ import re
 import sys
 import time
 import json
+import pickle
+import bisect
+import hashlib
+import functools
+import itertools
+import collections
+import signal
 import threading
+import selectors
 import subprocess
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Tuple
 
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory
 
 try:
     from proxmoxer import ProxmoxAPI
@@ -22,70 +30,109 @@ try:
 except ImportError:
     HAS_PROXMOXER = False
 
+_json_loads: Callable[[bytes], Any]
+_json_dumps: Callable[[Any], bytes]
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+
+    def _compact_json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    _json_loads = json.loads
+    _json_dumps = _compact_json_dumps
+
+try:
+    import ahocorasick
+
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
 BASE_DIR = Path(__file__).resolve().parents[1]
 DEPLOY_SCRIPT = BASE_DIR / "deploy.py"
-ANSI_ESCAPE = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
+ANSI_ESCAPE = re.compile(rb"\x1B\[[0-?]*[ -/]*[@-~]")
 ANSIBLE_TASK_PATTERN = re.compile(r"TASK\s+\[(.+?)\]")
 
 TFVARS_FILE = BASE_DIR / "terraform-opentofu" / "terraform.tfvars"
 TFVARS_EXAMPLE_FILE = BASE_DIR / "terraform-opentofu" / "terraform.tfvars.example"
 TFSTATE_FILE = BASE_DIR / "terraform-opentofu" / "terraform.tfstate"
 
+DEFAULT_LOG_LINES = 200
+
+
+def _log_line_limit() -> int:
+    """Read DEPLOY_UI_LOG_LINES, falling back to the default unless positive."""
+    try:
+        value = int(os.environ.get("DEPLOY_UI_LOG_LINES", DEFAULT_LOG_LINES))
+    except ValueError:
+        return DEFAULT_LOG_LINES
+    return value if value > 0 else DEFAULT_LOG_LINES
+
+
+# Keep only the last log lines to avoid unbounded growth
+MAX_LOG_LINES = _log_line_limit()
+# Bytes requested per read() from the deploy.py output pipe
+READ_CHUNK_SIZE = 65536
+# Seconds after a stop request before still-running children are killed;
+# None waits for terraform/ansible to finish their graceful shutdown
+STOP_KILL_AFTER: float | None = None
+
+
+# "#" and "//" comments, up to the end of the line
+TFVARS_COMMENT_PATTERN = re.compile(r"(?:#|//)[^\n]*")
+# vm_count, default_vm_role and the body of the vm_roles map, each at line start
+TFVARS_ROLE_SETTINGS_PATTERN = re.compile(
+    r"^[ \t]*(?:"
+    r"vm_count\s*=\s*(\d+)"
+    r'|default_vm_role\s*=\s*"([^"]+)"'
+    r"|vm_roles[^{}]*\{([^}]*)"
+    r")",
+    re.MULTILINE,
+)
+# One '"vm name" = "role"' entry per line inside the vm_roles map
+TFVARS_ROLE_ENTRY_PATTERN = re.compile(
+    r'^\s*"([^"]+)"\s*=\s*"([^"]+)"', re.MULTILINE
+)
+
 
 def determine_vm_role_usage() -> Dict[str, bool]:
     """Parse terraform.tfvars to detect whether k3s and docker roles are requested."""
-    vm_count = 1
-    default_role = "k3s"
-    explicit_roles: Dict[str, str] = {}
     tfvars_path = TFVARS_FILE if TFVARS_FILE.exists() else TFVARS_EXAMPLE_FILE
-
-    if not tfvars_path.exists():
-        return {"k3s": True, "docker": False}
-
     try:
-        with tfvars_path.open("r", encoding="utf-8") as tf_file:
-            in_vm_roles = False
-            for raw_line in tf_file:
-                line = re.sub(r"(#|//).*", "", raw_line).strip()
-                if not line:
-                    continue
-
-                if in_vm_roles:
-                    if line.startswith("}"):
-                        in_vm_roles = False
-                        continue
-                    match = re.match(r'"([^"]+)"\s*=\s*"([^"]+)"', line)
-                    if match:
-                        explicit_roles[match.group(1)] = match.group(2)
-                    continue
+        stat = tfvars_path.stat()
+    except OSError:
+        return {"k3s": True, "docker": False}
+    # Copy so callers cannot alter the memoized result
+    return dict(
+        _determine_vm_role_usage(str(tfvars_path), stat.st_mtime_ns, stat.st_size)
+    )
 
-                if line.startswith("vm_roles"):
-                    if "{" in line:
-                        brace_index = line.find("{")
-                        remainder = line[brace_index + 1 :].strip()
-                        if remainder and remainder != "}":
-                            match = re.match(r'"([^"]+)"\s*=\s*"([^"]+)"', remainder)
-                            if match:
-                                explicit_roles[match.group(1)] = match.group(2)
-                            if remainder.endswith("}"):
-                                continue
-                        if not remainder.endswith("}"):
-                            in_vm_roles = True
-                    else:
-                        in_vm_roles = True
-                    continue
 
-                match_count = re.match(r"vm_count\s*=\s*(\d+)", line)
-                if match_count:
-                    vm_count = int(match_count.group(1))
-                    continue
+@functools.lru_cache(maxsize=4)
+def _determine_vm_role_usage(path: str, mtime_ns: int, size: int) -> Dict[str, bool]:
+    """Parse role usage from a tfvars file, memoized by path, mtime and size."""
+    vm_count = 1
+    default_role = "k3s"
+    explicit_roles: Dict[str, str] = {}
 
-                match_default = re.match(
-                    r'default_vm_role\s*=\s*"([^"]+)"', line
+    try:
+        content = TFVARS_COMMENT_PATTERN.sub(
+            "", Path(path).read_text(encoding="utf-8")
+        )
+        for match in TFVARS_ROLE_SETTINGS_PATTERN.finditer(content):
+            count, role, roles_block = match.groups()
+            if count is not None:
+                vm_count = int(count)
+            elif role is not None:
+                default_role = role
+            else:
+                explicit_roles.update(
+                    TFVARS_ROLE_ENTRY_PATTERN.findall(roles_block)
                 )
-                if match_default:
-                    default_role = match_default.group(1)
-                    continue
 
         has_k3s = any(role == "k3s" for role in explicit_roles.values())
         has_docker = any(role == "docker" for role in explicit_roles.values())
@@ -105,6 +152,18 @@ def determine_vm_role_usage() -> Dict[str, bool]:
 
 def parse_proxmox_credentials() -> Dict[str, str]:
     """Extract Proxmox connection details from terraform.tfvars with fallbacks."""
+    tfvars_path = TFVARS_FILE if TFVARS_FILE.exists() else TFVARS_EXAMPLE_FILE
+    try:
+        mtime_ns = tfvars_path.stat().st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    # Copy so callers cannot alter the memoized result
+    return dict(_parse_proxmox_credentials(str(tfvars_path), mtime_ns))
+
+
+@functools.lru_cache(maxsize=2)
+def _parse_proxmox_credentials(path: str, mtime_ns: int | None) -> Dict[str, str]:
+    """Parse credentials from a tfvars file, memoized by path and mtime."""
     defaults = {
         "url": "",
         "host": "",
@@ -113,12 +172,11 @@ def parse_proxmox_credentials() -> Dict[str, str]:
         "node": "",
         "host_user": "",
     }
-    tfvars_path = TFVARS_FILE if TFVARS_FILE.exists() else TFVARS_EXAMPLE_FILE
-    if not tfvars_path.exists():
+    if mtime_ns is None:
         return defaults
 
     try:
-        with tfvars_path.open("r", encoding="utf-8") as tf_file:
+        with open(path, "r", encoding="utf-8") as tf_file:
             content = tf_file.read()
 
         url_match = re.search(r'proxmox_api_url\s*=\s*"([^"]+)"', content)
@@ -184,13 +242,20 @@ def _parse_tfstate_outputs(outputs: Dict) -> List[Dict]:
     return []
 
 
+@functools.lru_cache(maxsize=2)
+def _load_tfstate(path: str, mtime_ns: int) -> Dict:
+    """Decode a tfstate file, memoized by path and modification time."""
+    return _json_loads(Path(path).read_bytes())
+
+
 def get_tfstate_vm_info() -> List[Dict]:
     """Read terraform.tfstate to build a VM inventory list."""
     if not TFSTATE_FILE.exists():
         return []
 
     try:
-        data = json.loads(TFSTATE_FILE.read_text())
+        mtime_ns = TFSTATE_FILE.stat().st_mtime_ns
+        data = _load_tfstate(str(TFSTATE_FILE), mtime_ns)
     except Exception:
         return []
 
@@ -229,11 +294,23 @@ def get_tfstate_vm_info() -> List[Dict]:
     return vms
 
 
+# Host and optional port of a Proxmox API URL (e.g. https://host:8006/api2/json)
+PROXMOX_URL_PATTERN = re.compile(r"^(?:https?://)?([^:/]+)(?::(\d+))?")
+# Seconds a logged-in proxmoxer client is reused before logging in again
+PROXMOX_CLIENT_TTL = 300
+_PROXMOX_CLIENT_CACHE: Dict[str, Tuple[float, ProxmoxAPI]] = {}
+
+
 def connect_proxmox(creds: Dict) -> ProxmoxAPI | None:
-    """Create a proxmoxer client from credentials."""
+    """Create a proxmoxer client from credentials, reusing a recent one."""
     if not HAS_PROXMOXER:
         return None
 
+    cache_key = hashlib.sha1(repr(sorted(creds.items())).encode()).hexdigest()
+    cached = _PROXMOX_CLIENT_CACHE.get(cache_key)
+    if cached and time.monotonic() - cached[0] < PROXMOX_CLIENT_TTL:
+        return cached[1]
+
     url = creds.get("url", "")
     host_override = creds.get("host", "")
     user = creds.get("user", "")
@@ -241,17 +318,13 @@ def connect_proxmox(creds: Dict) -> ProxmoxAPI | None:
     if not (url or host_override) or not user or not password:
         return None
 
-    # Extract host/port from full API URL (e.g. https://host:8006/api2/json)
-    host_port_source = url or host_override
-    host_port = host_port_source.replace("https://", "").replace("http://", "")
-    host_port = host_port.split("/")[0]
-    if ":" in host_port:
-        host, port_str = host_port.split(":", 1)
-    else:
-        host, port_str = host_port, "8006"
+    match = PROXMOX_URL_PATTERN.match(url or host_override)
+    if not match:
+        return None
+    host, port_str = match.group(1), match.group(2) or "8006"
 
     try:
-        return ProxmoxAPI(
+        client = ProxmoxAPI(
             host,
             user=user,
             password=password,
@@ -260,9 +333,50 @@ def connect_proxmox(creds: Dict) -> ProxmoxAPI | None:
         )
     except Exception:
         return None
+    # Only the current credentials' client is worth keeping
+    _PROXMOX_CLIENT_CACHE.clear()
+    _PROXMOX_CLIENT_CACHE[cache_key] = (time.monotonic(), client)
+    return client
+
+
+def forget_proxmox_client(client: ProxmoxAPI) -> None:
+    """Drop a cached client whose requests fail, so the next call logs in."""
+    global _VM_STATS_CACHE
+    # pop(), since another request thread may clear the cache concurrently
+    for cache_key, (_, cached_client) in list(_PROXMOX_CLIENT_CACHE.items()):
+        if cached_client is client:
+            _PROXMOX_CLIENT_CACHE.pop(cache_key, None)
+    if _VM_STATS_CACHE and _VM_STATS_CACHE[0] is client:
+        _VM_STATS_CACHE = None
+
+
+# Seconds a cluster resources listing is reused across metrics polls
+VM_STATS_TTL = 3
+_VM_STATS_CACHE: Tuple[ProxmoxAPI, float, List[Dict]] | None = None
+
+
+def get_cluster_vm_stats(client: ProxmoxAPI) -> List[Dict]:
+    """Return the cluster's VM resources, reusing a listing from the last few seconds."""
+    global _VM_STATS_CACHE
+    cached = _VM_STATS_CACHE
+    if (
+        cached
+        and cached[0] is client
+        and time.monotonic() - cached[1] < VM_STATS_TTL
+    ):
+        return cached[2]
+
+    try:
+        stats = client.cluster.resources.get(type="vm")
+    except Exception:
+        # An expired ticket would otherwise fail until PROXMOX_CLIENT_TTL
+        forget_proxmox_client(client)
+        raise
+    _VM_STATS_CACHE = (client, time.monotonic(), stats)
+    return stats
 
 
-STAGE_DEFINITIONS = {
+STAGE_DEFINITIONS: Dict[str, List[Dict[str, Any]]] = {
     "deploy": [
         {
             "id": "setup",
@@ -411,10 +525,27 @@ TERRAFORM_TASK_SEQUENCE = [
         "complete_keywords": ["✓ Infrastructure created successfully"],
     },
 ]
-TERRAFORM_KEYWORDS = set()
-for task in TERRAFORM_TASK_SEQUENCE:
-    TERRAFORM_KEYWORDS.update(task.get("keywords", []))
-    TERRAFORM_KEYWORDS.update(task.get("complete_keywords", []))
+
+
+def _build_keyword_map(
+    sequence: List[Dict], lower: bool = False
+) -> Dict[str, Tuple[int, bool]]:
+    """Map each task keyword to (task_index, is_complete).
+
+    A keyword listed as both start and complete keeps its start entry.
+    """
+    keyword_map: Dict[str, Tuple[int, bool]] = {}
+    for idx, config in enumerate(sequence):
+        for complete, key in ((False, "keywords"), (True, "complete_keywords")):
+            for keyword in config.get(key, []):
+                if lower:
+                    keyword = keyword.lower()
+                keyword_map.setdefault(keyword, (idx, complete))
+    return keyword_map
+
+
+_TF_KEYWORD_MAP = _build_keyword_map(TERRAFORM_TASK_SEQUENCE)
+TERRAFORM_KEYWORDS = set(_TF_KEYWORD_MAP)
 
 DESTROY_TASK_SEQUENCE = [
     {
@@ -444,6 +575,8 @@ for task in DESTROY_TASK_SEQUENCE:
     DESTROY_KEYWORDS.update(task.get("keywords", []))
     DESTROY_KEYWORDS.update(task.get("complete_keywords", []))
 DESTROY_KEYWORDS.update({"Destroying...", "Destruction complete"})
+# Destroy progress is matched case-insensitively, so keys are pre-lowered
+_DESTROY_KEYWORD_MAP = _build_keyword_map(DESTROY_TASK_SEQUENCE, lower=True)
 
 HEADER_STAGE_MAP = {
     "INITIAL SETUP AND VALIDATION": "setup",
@@ -459,29 +592,313 @@ ANSIBLE_STAGE_KEYWORDS = {
     "NAT rule removal": "destroy_nat",
 }
 
+# Literal Ansible phrases per stage, built once instead of per log line.
+# "{label} failed" also covers "Ansible {label} failed".
+_ANSIBLE_START = {
+    f"Running Ansible {label}": stage_id
+    for label, stage_id in ANSIBLE_STAGE_KEYWORDS.items()
+}
+_ANSIBLE_DONE = {
+    f"Ansible {label} completed successfully": stage_id
+    for label, stage_id in ANSIBLE_STAGE_KEYWORDS.items()
+}
+_ANSIBLE_FAIL = {
+    f"{label} failed": stage_id
+    for label, stage_id in ANSIBLE_STAGE_KEYWORDS.items()
+}
+
+
+class KeywordScanner:
+    """Find every occurrence of a fixed set of literal keywords in one pass.
+
+    Uses a pyahocorasick automaton when available and otherwise falls back
+    to a single regex alternation. Each keyword can carry several payloads.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, Any]]) -> None:
+        payloads: Dict[str, List[Any]] = {}
+        for keyword, payload in entries:
+            payloads.setdefault(keyword, []).append(payload)
+
+        if HAS_AHOCORASICK:
+            self._automaton = ahocorasick.Automaton()
+            for keyword, values in payloads.items():
+                self._automaton.add_word(keyword, (len(keyword), tuple(values)))
+            self._automaton.make_automaton()
+            return
+
+        # The lookahead reports the longest keyword at each position, so
+        # fold in the payloads of shorter keywords that are its prefixes.
+        self._automaton = None
+        self._payloads = {
+            keyword: tuple(
+                value
+                for other, values in payloads.items()
+                if keyword.startswith(other)
+                for value in values
+            )
+            for keyword in payloads
+        }
+        ordered = sorted(payloads, key=len, reverse=True)
+        self._pattern = re.compile(
+            "(?=(" + "|".join(re.escape(keyword) for keyword in ordered) + "))"
+        )
+
+    def scan(self, line: str) -> List[Tuple[int, Any]]:
+        """Return (start_index, payload) for every keyword found in line."""
+        if self._automaton is not None:
+            return [
+                (end - length + 1, value)
+                for end, (length, values) in self._automaton.iter(line)
+                for value in values
+            ]
+        return [
+            (match.start(), value)
+            for match in self._pattern.finditer(line)
+            for value in self._payloads[match.group(1)]
+        ]
+
+
+def _build_line_scanner(progress_events: Iterable[str]) -> KeywordScanner:
+    """Index stage/progress keywords as (kind, rank, value) payloads.
+
+    Progress keywords are only indexed when one of progress_events consumes
+    them; _record_progress_event ignores the rest anyway.
+    """
+    progress_events = set(progress_events)
+    entries: List[Tuple[str, Any]] = []
+    if "ansible_task" in progress_events:
+        entries.append(("TASK [", ("task", 0, None)))
+    for rank, (header_text, stage_id) in enumerate(HEADER_STAGE_MAP.items()):
+        entries.append((header_text, ("header", rank, stage_id)))
+    # Rank by stage first, then start > complete > fail within a stage
+    phrase_tables = (
+        ("start", _ANSIBLE_START),
+        ("complete", _ANSIBLE_DONE),
+        ("fail", _ANSIBLE_FAIL),
+    )
+    for action_rank, (action, table) in enumerate(phrase_tables):
+        for stage_rank, (phrase, stage_id) in enumerate(table.items()):
+            rank = stage_rank * len(phrase_tables) + action_rank
+            entries.append((phrase, ("ansible", rank, (action, stage_id))))
+    # The first task with a hit wins, and its start beats its completion
+    if "terraform_step" in progress_events:
+        for keyword, (idx, complete) in _TF_KEYWORD_MAP.items():
+            rank = idx * 2 + complete
+            entries.append((keyword, ("terraform", rank, (idx, complete))))
+    if "terraform_destroy" in progress_events:
+        for keyword in DESTROY_KEYWORDS:
+            entries.append((keyword, ("destroy", 0, None)))
+    entries.append(("Performing", ("performing", 0, None)))
+    entries.append(
+        ("Deployment completed successfully", ("deploy_done", 0, None))
+    )
+    return KeywordScanner(entries)
+
+
+# One scanner per mode, indexing only the progress keywords its stages use
+LINE_SCANNERS = {
+    mode: _build_line_scanner(
+        stage["progress_event"]
+        for stage in definitions
+        if stage.get("progress_event")
+    )
+    for mode, definitions in STAGE_DEFINITIONS.items()
+}
+# Scanned against the lowercased line; payloads are (task_index, is_complete)
+DESTROY_PROGRESS_SCANNER = KeywordScanner(_DESTROY_KEYWORD_MAP.items())
+
+
+def _build_stage_entry(stage: Dict) -> Dict:
+    """Create the initial runtime state for a stage definition."""
+    stage_entry = {
+        "id": stage["id"],
+        "title": stage["title"],
+        "description": stage["description"],
+        "tool": stage.get("tool", "Ansible"),
+        "progress_event": stage.get("progress_event"),
+        "tasks": [
+            {"label": task, "status": "pending"}
+            for task in stage.get("tasks", [])
+        ],
+        "status": "pending",
+        "note": "Waiting to start.",
+    }
+    stage_entry["base_task_count"] = len(stage_entry["tasks"])
+    # Private bookkeeping (underscore keys) is left out of API snapshots:
+    # label occurrence counts, indices of tasks that may be running, the
+    # lowest index that may still be pending (only base tasks start out
+    # pending and none return to it), how many leading base tasks are
+    # known to be completed and the sorted (label, index) pairs of destroy
+    # tasks for prefix lookups.
+    stage_entry["_label_counts"] = collections.Counter(stage.get("tasks", []))
+    stage_entry["_running"] = []
+    stage_entry["_first_pending"] = 0
+    stage_entry["_base_done"] = 0
+    stage_entry["_destroy_labels"] = []
+    return stage_entry
+
+
+@functools.lru_cache(maxsize=None)
+def _stage_template(
+    mode: str, enabled_roles: frozenset
+) -> Tuple[bytes, Dict[str, int]]:
+    """Return the pickled stages that apply to enabled_roles, plus id -> index.
+
+    Unpickling a fresh copy on reset is cheaper than rebuilding every stage
+    and task dict. The lookup is shared between runs and must not be mutated.
+    """
+    stages = [
+        _build_stage_entry(stage)
+        for stage in STAGE_DEFINITIONS[mode]
+        if not stage.get("requires_role") or stage["requires_role"] in enabled_roles
+    ]
+    lookup = {stage["id"]: idx for idx, stage in enumerate(stages)}
+    return pickle.dumps(stages), lookup
+
+
+def _split_output_block(block: bytes) -> List[str]:
+    """Return the non-empty lines of a block of complete lines, decoded.
+
+    Escape sequences never span a line break, so ANSI codes are removed
+    from the whole block with one substitution, and only when it contains
+    an ESC byte at all.
+    """
+    if b"\x1b" in block:
+        block = ANSI_ESCAPE.sub(b"", block)
+    return [
+        raw_line.decode("utf-8", "replace")
+        for raw_line in map(bytes.strip, block.splitlines())
+        if raw_line
+    ]
+
+
+def _iter_output_blocks(
+    fd: int,
+    wake_fd: int | None = None,
+    on_wake: Callable[[], None] | None = None,
+) -> Iterator[List[str]]:
+    """Yield the cleaned, non-empty lines of each read from a binary pipe.
+
+    The pipe is switched to non-blocking mode and drained in large chunks
+    on every wakeup; lines end at LF, CRLF or a bare CR, as in universal
+    newlines mode. Blank lines are dropped before any decoding work.
+    When wake_fd becomes readable, on_wake is called once and reading
+    continues until EOF.
+    """
+    os.set_blocking(fd, False)
+    pending = bytearray()
+    eof = False
+    with selectors.DefaultSelector() as selector:
+        selector.register(fd, selectors.EVENT_READ)
+        if wake_fd is not None:
+            selector.register(wake_fd, selectors.EVENT_READ)
+        while not eof:
+            events = selector.select()
+            if wake_fd is not None and any(
+                key.fd == wake_fd for key, _ in events
+            ):
+                selector.unregister(wake_fd)
+                wake_fd = None
+                if on_wake is not None:
+                    on_wake()
+                continue
+            while True:
+                try:
+                    chunk = os.read(fd, READ_CHUNK_SIZE)
+                except BlockingIOError:
+                    break
+                if not chunk:
+                    eof = True
+                    break
+                pending += chunk
+                if len(chunk) < READ_CHUNK_SIZE:
+                    break
+            cut = max(pending.rfind(b"\n"), pending.rfind(b"\r")) + 1
+            if cut:
+                lines = _split_output_block(bytes(pending[:cut]))
+                del pending[:cut]
+                if lines:
+                    yield lines
+    lines = _split_output_block(bytes(pending))
+    if lines:
+        yield lines
+
+
+def _signal_process_group(pgid: int, sig: int) -> None:
+    """Send sig to a process group, ignoring groups that already exited."""
+    try:
+        os.killpg(pgid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def _process_group_alive(pgid: int) -> bool:
+    """Whether a process group still has members that are not zombies."""
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    proc = Path("/proc")
+    if not proc.is_dir():
+        return True
+    # Orphaned zombies still count for killpg() until init reaps them
+    for stat_path in proc.glob("[0-9]*/stat"):
+        try:
+            fields = stat_path.read_text().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[2]) == pgid and fields[0] != "Z":
+            return True
+    return False
+
+
+def _wait_process_group(pgid: int) -> None:
+    """Block until every process in a process group has exited."""
+    while _process_group_alive(pgid):
+        time.sleep(0.2)
+
 
 class DeploymentRunner:
     """Background runner that executes deploy.py and tracks stage progress."""
 
+    # Per-run state, set by _reset_state()
+    stage_state: List[Dict]
+    _stage_lookup: Dict[str, int]
+    _line_scanner: KeywordScanner
+    current_stage: str | None
+    started_at: float | None
+    finished_at: float | None
+    return_code: int | None
+
     def __init__(self) -> None:
-        self._lock = threading.Lock()
+        # Stage state and the log buffer have separate locks so appending
+        # output lines does not contend with stage updates or status polls.
+        self._state_lock = threading.Lock()
+        self._log_lock = threading.Lock()
         self._thread: threading.Thread | None = None
-        self.running = False
-        self.logs: List[str] = []
-        self.stage_state: List[Dict] = []
-        self.current_stage: str | None = None
-        self.started_at: float | None = None
-        self.finished_at: float | None = None
-        self.return_code: int | None = None
+        # Self-pipe written by stop() to wake the output reader
+        self._wake_pipe: Tuple[int, int] | None = None
+        self._stop_requested = False
+        self._kill_timer: threading.Timer | None = None
+        # Set while a run is active; is_set() needs no lock
+        self._running = threading.Event()
+        self.logs: Deque[str] = collections.deque(maxlen=MAX_LOG_LINES)
+        # Total lines ever logged, and the count when the current run began
+        self._log_seq = 0
+        self._log_run_start = 0
         self.mode = DEFAULT_MODE
-        self._stage_lookup: Dict[str, int] = {}
+        # Bumped on every stage mutation so status polls can reuse a snapshot
+        self._state_version = 0
+        self._snapshot_cache: Tuple[int, Dict, bytes] | None = None
         self.role_usage = determine_vm_role_usage()
+        # Sets up the per-run stage state, timestamps and return code
         self._reset_state()
 
     def start(self, mode: str = DEFAULT_MODE) -> bool:
         """Start a new deployment run if one is not already active."""
-        with self._lock:
-            if self.running:
+        with self._state_lock:
+            if self._running.is_set():
                 return False
 
             if mode not in STAGE_DEFINITIONS:
@@ -489,73 +906,146 @@ class DeploymentRunner:
             self.mode = mode
             self.role_usage = determine_vm_role_usage()
             self._reset_state()
-            self.running = True
+            self._running.set()
             self.started_at = time.time()
+            self._state_version += 1
+            self._wake_pipe = os.pipe()
+            self._stop_requested = False
             self._thread = threading.Thread(
                 target=self._run_deploy, name="deploy-runner", daemon=True
             )
             self._thread.start()
             return True
 
-    def status_snapshot(self) -> Dict:
-        """Return a copy of the current status for API responses."""
-        with self._lock:
-            stages = []
-            for stage in self.stage_state:
-                stage_copy = stage.copy()
-                stage_copy["tasks"] = [
-                    task.copy() for task in stage.get("tasks", [])
-                ]
-                stages.append(stage_copy)
-
-            return {
-                "running": self.running,
-                "started_at": self.started_at,
-                "finished_at": self.finished_at,
-                "return_code": self.return_code,
-                "mode": self.mode,
-                "stages": stages,
-                "logs": list(self.logs),
-            }
+    @property
+    def running(self) -> bool:
+        """Whether a deploy.py run is in progress."""
+        return self._running.is_set()
+
+    def stop(self) -> bool:
+        """Ask the active run to terminate deploy.py.
+
+        The run stays active until deploy.py and every child process it
+        started have exited.
+        """
+        with self._state_lock:
+            if not self._running.is_set() or self._wake_pipe is None:
+                return False
+            self._stop_requested = True
+            os.write(self._wake_pipe[1], b"x")
+            return True
+
+    def status_snapshot(self, since_seq: int | None = None) -> Dict:
+        """Return the current status for API responses as a dict.
+
+        Everything except the logs is cached until the next state change
+        and shared between callers, so it must be treated as read-only.
+        When since_seq is a log_seq from an earlier snapshot of this run,
+        only the lines logged after it are returned and logs_complete is
+        False; otherwise the whole buffer is returned.
+        """
+        state, _ = self._cached_state()
+        return {**state, **self._log_payload(since_seq)}
+
+    def status_json(self, since_seq: int | None = None) -> bytes:
+        """Return status_snapshot() encoded as JSON.
+
+        The encoded stage state is cached with the snapshot, so polls that
+        see no state change only encode the log fields.
+        """
+        _, encoded_state = self._cached_state()
+        encoded_logs = _json_dumps(self._log_payload(since_seq))
+        return encoded_state + b"," + encoded_logs[1:]
 
     # Internal helpers -----------------------------------------------------
-    def _reset_state(self) -> None:
-        self.stage_state = []
-        definitions = STAGE_DEFINITIONS.get(self.mode, [])
-        for stage in definitions:
-            required_role = stage.get("requires_role")
-            if required_role and not self.role_usage.get(required_role, False):
-                continue
-            stage_entry = {
-                "id": stage["id"],
-                "title": stage["title"],
-                "description": stage["description"],
-                "tool": stage.get("tool", "Ansible"),
-                "progress_event": stage.get("progress_event"),
-                "tasks": [
-                    {"label": task, "status": "pending"}
-                    for task in stage.get("tasks", [])
-                ],
-                "status": "pending",
-                "note": "Waiting to start.",
+    def _cached_state(self) -> Tuple[Dict, bytes]:
+        # The cache tuple is replaced whole and never mutated, so a poll that
+        # finds it current can skip the lock. A mutation racing with this
+        # check bumps the version under the lock, so at worst the previous
+        # complete snapshot is served.
+        cached = self._snapshot_cache
+        if cached is not None and cached[0] == self._state_version:
+            return cached[1], cached[2]
+        with self._state_lock:
+            cached = self._snapshot_cache
+            if cached is None or cached[0] != self._state_version:
+                state = self._build_snapshot()
+                # Encoded without the closing brace so log fields can follow
+                encoded = _json_dumps(state)[:-1]
+                cached = (self._state_version, state, encoded)
+                self._snapshot_cache = cached
+            return cached[1], cached[2]
+
+    def _log_payload(self, since_seq: int | None) -> Dict:
+        with self._log_lock:
+            log_seq = self._log_seq
+            new_count = log_seq - since_seq if since_seq is not None else -1
+            # A since_seq equal to the run start may be the previous run's
+            # last poll, so the client must replace its lines in that case
+            incremental = (
+                since_seq is not None
+                and since_seq > self._log_run_start
+                and 0 <= new_count <= len(self.logs)
+            )
+            if incremental:
+                start = len(self.logs) - new_count
+                logs = list(itertools.islice(self.logs, start, None))
+            else:
+                logs = list(self.logs)
+        return {
+            "logs": logs,
+            "log_seq": log_seq,
+            "logs_complete": not incremental,
+        }
+
+    def _build_snapshot(self) -> Dict:
+        """Copy the stage state for the API; caller holds the state lock."""
+        stages = []
+        for stage in self.stage_state:
+            stage_copy = {
+                key: value
+                for key, value in stage.items()
+                if not key.startswith("_")
             }
-            stage_entry["base_task_count"] = len(stage_entry["tasks"])
-            self.stage_state.append(stage_entry)
-        self._stage_lookup = {
-            stage["id"]: idx for idx, stage in enumerate(self.stage_state)
+            stage_copy["tasks"] = [
+                {"label": task["label"], "status": task["status"]}
+                for task in stage.get("tasks", [])
+            ]
+            stages.append(stage_copy)
+        return {
+            "running": self._running.is_set(),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "return_code": self.return_code,
+            "mode": self.mode,
+            "stages": stages,
         }
-        self.logs = []
+
+    def _reset_state(self) -> None:
+        enabled_roles = frozenset(
+            role for role, used in self.role_usage.items() if used
+        )
+        template, self._stage_lookup = _stage_template(self.mode, enabled_roles)
+        self.stage_state = pickle.loads(template)
+        self._line_scanner = LINE_SCANNERS[self.mode]
+        with self._log_lock:
+            self.logs.clear()
+            self._log_run_start = self._log_seq
         self.current_stage = None
         self.started_at = None
         self.finished_at = None
         self.return_code = None
+        self._state_version += 1
 
     def _append_log(self, line: str) -> None:
-        with self._lock:
+        with self._log_lock:
             self.logs.append(line)
-            # Keep the last 200 log lines to avoid unbounded growth
-            if len(self.logs) > 200:
-                self.logs = self.logs[-200:]
+            self._log_seq += 1
+
+    def _append_logs(self, lines: List[str]) -> None:
+        with self._log_lock:
+            self.logs.extend(lines)
+            self._log_seq += len(lines)
 
     def _run_deploy(self) -> None:
         env = os.environ.copy()
@@ -569,28 +1059,48 @@ class DeploymentRunner:
             cwd=str(BASE_DIR),
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
+            bufsize=0,
             env=env,
+            # Own process group, so a stop also reaches terraform/ansible
+            start_new_session=True,
         )
 
         if not process.stdout:
             self._append_log("Failed to attach to deploy.py stdout.")
+            self._close_wake_pipe()
             self._finalize_run(False)
             return
 
+        stopping = False
+
+        def terminate() -> None:
+            nonlocal stopping
+            stopping = True
+            self._terminate_process_group(process.pid)
+
         try:
-            for raw_line in process.stdout:
-                line = ANSI_ESCAPE.sub("", raw_line).strip()
-                if not line:
-                    continue
-                self._handle_line(line)
+            wake_fd = self._wake_pipe[0] if self._wake_pipe else None
+            # Output is still read after a stop so terraform and ansible can
+            # report their shutdown instead of dying on a closed pipe
+            for lines in _iter_output_blocks(
+                process.stdout.fileno(), wake_fd, terminate
+            ):
+                self._handle_lines(lines)
         finally:
             process.stdout.close()
+            self._close_wake_pipe()
             return_code = process.wait()
+            if stopping:
+                # Children may outlive deploy.py; a new run must not start
+                # while a terraform apply or destroy is still going
+                _wait_process_group(process.pid)
+                if self._kill_timer is not None:
+                    self._kill_timer.cancel()
+                    self._kill_timer = None
             success = return_code == 0
-            with self._lock:
+            with self._state_lock:
                 self.return_code = return_code
+                self._state_version += 1
             if not success and self.current_stage:
                 self._complete_stage(
                     self.current_stage,
@@ -600,48 +1110,88 @@ class DeploymentRunner:
                 self._append_log(f"deploy.py exited with code {return_code}")
             self._finalize_run(success)
 
-    def _handle_line(self, line: str) -> None:
-        self._append_log(line)
-        if "TASK [" in line:
-            self._record_progress_event("ansible_task", line)
+    def _terminate_process_group(self, pgid: int) -> None:
+        self._append_log(
+            "Stop requested, terminating deploy.py and its child processes."
+        )
+        _signal_process_group(pgid, signal.SIGTERM)
+        if STOP_KILL_AFTER is not None:
+            self._kill_timer = threading.Timer(
+                STOP_KILL_AFTER,
+                _signal_process_group,
+                (pgid, signal.SIGKILL),
+            )
+            self._kill_timer.daemon = True
+            self._kill_timer.start()
+
+    def _close_wake_pipe(self) -> None:
+        with self._state_lock:
+            if self._wake_pipe is not None:
+                for fd in self._wake_pipe:
+                    os.close(fd)
+                self._wake_pipe = None
+
+    def _handle_lines(self, lines: List[str]) -> None:
+        # One log lock round trip per read chunk instead of one per line;
+        # lines emitted by _handle_line follow the line that triggered them
+        log_lines: List[str] = []
+        for line in lines:
+            log_lines.append(line)
+            self._handle_line(line, log_lines)
+        self._append_logs(log_lines)
+
+    def _handle_line(self, line: str, log_lines: List[str]) -> None:
+        # Keep the highest-priority (then leftmost) hit for each keyword kind
+        found: Dict[str, Tuple[int, int, Any]] = {}
+        for start, (kind, rank, value) in self._line_scanner.scan(line):
+            hit = (rank, start, value)
+            if kind not in found or hit[:2] < found[kind][:2]:
+                found[kind] = hit
+
+        if "task" in found:
+            self._record_progress_event(
+                "ansible_task",
+                line,
+                task_name=self._extract_ansible_task_name(line, found["task"][1]),
+            )
 
         # Detect headers for high level stages
-        for header_text, stage_id in HEADER_STAGE_MAP.items():
-            if header_text in line:
-                self._start_stage(stage_id)
-                return
+        if "header" in found:
+            self._start_stage(found["header"][2])
+            return
 
         # Detect Ansible stage events
-        for label, stage_id in ANSIBLE_STAGE_KEYWORDS.items():
-            if f"Running Ansible {label}" in line:
+        if "ansible" in found:
+            action, stage_id = found["ansible"][2]
+            if action == "start":
                 self._start_stage(stage_id)
-                return
-            if f"Ansible {label} completed successfully" in line:
+            elif action == "complete":
                 self._complete_stage(stage_id, "completed", "Finished.")
-                return
-            if f"Ansible {label} failed" in line or f"{label} failed" in line:
+            else:
                 self._complete_stage(
                     stage_id, "failed", "Failed. Check deployment logs."
                 )
-                return
+            return
 
-        if any(keyword in line for keyword in TERRAFORM_KEYWORDS):
-            self._record_progress_event("terraform_step", line)
+        if "terraform" in found:
+            self._record_progress_event(
+                "terraform_step", line, step=found["terraform"][2]
+            )
 
-        if any(keyword in line for keyword in DESTROY_KEYWORDS):
+        if "destroy" in found:
             self._record_progress_event("terraform_destroy", line)
 
-        if "Performing" in line and "destroy" in line.lower():
+        if "performing" in found and "destroy" in line.lower():
             self._start_stage("destroy_tf")
             return
 
-        if "Deployment completed successfully" in line:
+        if "deploy_done" in found:
             if self.current_stage:
                 self._complete_stage(self.current_stage, "completed", "Finished.")
-            self._append_log("All stages completed.")
+            log_lines.append("All stages completed.")
 
     def _start_stage(self, stage_id: str) -> None:
-        with self._lock:
+        with self._state_lock:
             if stage_id not in self._stage_lookup:
                 return
             if self.current_stage and self.current_stage != stage_id:
@@ -654,9 +1204,10 @@ class DeploymentRunner:
             stage["note"] = "In progress..."
             self._mark_tasks(stage, "start")
             self.current_stage = stage_id
+            self._state_version += 1
 
     def _complete_stage(self, stage_id: str, status: str, note: str) -> None:
-        with self._lock:
+        with self._state_lock:
             if stage_id not in self._stage_lookup:
                 return
             stage = self.stage_state[self._stage_lookup[stage_id]]
@@ -670,9 +1221,10 @@ class DeploymentRunner:
                 self._mark_tasks(stage, "skip")
             if self.current_stage == stage_id:
                 self.current_stage = None
+            self._state_version += 1
 
     def _finalize_run(self, success: bool) -> None:
-        with self._lock:
+        with self._state_lock:
             if self.current_stage:
                 final_status = "completed" if success else "failed"
                 note = "Finished." if success else "Deployment stopped."
@@ -691,21 +1243,28 @@ class DeploymentRunner:
                     stage["note"] = "Not executed in this run."
                     self._mark_tasks(stage, "skip")
 
-            self.running = False
+            self._running.clear()
             self.finished_at = time.time()
-
-    def _record_progress_event(self, event_type: str, line: str | None = None) -> None:
-        with self._lock:
+            self._state_version += 1
+
+    def _record_progress_event(
+        self,
+        event_type: str,
+        line: str | None = None,
+        step: Tuple[int, bool] | None = None,
+        task_name: str | None = None,
+    ) -> None:
+        with self._state_lock:
             if not self.current_stage or self.current_stage not in self._stage_lookup:
                 return
             stage = self.stage_state[self._stage_lookup[self.current_stage]]
             if stage.get("progress_event") != event_type:
                 return
+            self._state_version += 1
             if event_type == "ansible_task":
-                task_name = self._extract_ansible_task_name(line)
                 self._advance_task(stage, task_name=task_name)
             elif event_type == "terraform_step":
-                self._advance_terraform_task(stage, line)
+                self._advance_terraform_task(stage, line, step)
             elif event_type == "terraform_destroy":
                 self._advance_destroy_task(stage, line)
 
@@ -716,80 +1275,53 @@ class DeploymentRunner:
 
         if task_name:
             # Complete current running tasks before starting a new one
-            for task in tasks:
-                if task["status"] == "running":
-                    task["status"] = "completed"
+            self._finish_running_tasks(stage, "completed")
             # Ensure unique labels for repeated task names
-            label = task_name
-            existing_running = next(
-                (task for task in tasks if task["label"] == label and task["status"] == "running"),
-                None,
-            )
-            if existing_running:
-                return
-
-            duplicate_count = sum(
-                1 for task in tasks if task["label"].startswith(task_name)
-            )
-            if duplicate_count:
-                label = f"{task_name} ({duplicate_count + 1})"
-
-            tasks.append({"label": label, "status": "running"})
+            self._append_running_task(stage, self._unique_label(stage, task_name))
             return
 
-        running_index = None
-        for idx, task in enumerate(tasks):
-            if task["status"] == "running":
-                running_index = idx
-                break
-
-        if running_index is not None:
+        running = [i for i in stage["_running"] if tasks[i]["status"] == "running"]
+        if running:
+            running_index = min(running)
             tasks[running_index]["status"] = "completed"
-            for next_idx in range(running_index + 1, len(tasks)):
-                if tasks[next_idx]["status"] == "pending":
-                    tasks[next_idx]["status"] = "running"
-                    break
-            return
-
-        for task in tasks:
-            if task["status"] == "pending":
-                task["status"] = "running"
-                break
-
-    def _extract_ansible_task_name(self, line: str | None) -> str | None:
-        if not line:
-            return None
-        match = ANSIBLE_TASK_PATTERN.search(line)
+            next_index = self._next_pending(stage, running_index + 1)
+        else:
+            next_index = self._next_pending(stage)
+        if next_index is not None:
+            self._start_task(stage, next_index)
+
+    def _unique_label(self, stage: Dict, base_label: str) -> str:
+        """Return base_label, suffixed with its occurrence number on repeats."""
+        label_counts = stage["_label_counts"]
+        count = label_counts[base_label]
+        label_counts[base_label] = count + 1
+        return f"{base_label} ({count + 1})" if count else base_label
+
+    def _extract_ansible_task_name(self, line: str, start: int) -> str | None:
+        # start is where the scanner found "TASK [", so no search is needed
+        match = ANSIBLE_TASK_PATTERN.match(line, start)
         if not match:
             return None
         return match.group(1).strip()
 
-    def _advance_terraform_task(self, stage: Dict, line: str | None) -> None:
-        if not line:
+    def _advance_terraform_task(
+        self, stage: Dict, line: str | None, step: Tuple[int, bool] | None
+    ) -> None:
+        if not line or step is None:
             return
         tasks = stage.get("tasks", [])
         if not tasks:
             return
 
-        for idx, config in enumerate(TERRAFORM_TASK_SEQUENCE):
-            keywords = config.get("keywords", [])
-            complete_keywords = config.get("complete_keywords", [])
-
-            if any(keyword in line for keyword in keywords):
-                self._ensure_base_task_progress(
-                    stage, idx, complete=False, sequence=TERRAFORM_TASK_SEQUENCE
-                )
-                if "[INFO] Creating" in line:
-                    self._add_creation_task(stage, line)
-                return
-
-            if any(keyword in line for keyword in complete_keywords):
-                self._ensure_base_task_progress(
-                    stage, idx, complete=True, sequence=TERRAFORM_TASK_SEQUENCE
-                )
-                if config["label"] == "Apply infrastructure":
-                    self._complete_dynamic_tasks(stage)
-                return
+        idx, complete = step
+        self._ensure_base_task_progress(
+            stage, idx, complete=complete, sequence=TERRAFORM_TASK_SEQUENCE
+        )
+        if not complete:
+            if "[INFO] Creating" in line:
+                self._add_creation_task(stage, line)
+        elif TERRAFORM_TASK_SEQUENCE[idx]["label"] == "Apply infrastructure":
+            self._complete_dynamic_tasks(stage)
 
     def _ensure_base_task_progress(
         self, stage: Dict, target_index: int, complete: bool, sequence: List[Dict]
@@ -801,18 +1333,22 @@ class DeploymentRunner:
         if target_index >= base_count:
             return
 
-        for i in range(base_count):
-            if i < target_index and tasks[i]["status"] != "completed":
-                tasks[i]["status"] = "completed"
-            elif i == target_index:
-                if complete:
-                    tasks[i]["status"] = "completed"
-                    if i + 1 < base_count and tasks[i + 1]["status"] == "pending":
-                        tasks[i + 1]["status"] = "running"
-                else:
-                    if tasks[i]["status"] != "completed":
-                        tasks[i]["status"] = "running"
-                break
+        # Completed is final, so skip the base tasks already known to be done
+        done = stage["_base_done"]
+        for i in range(done, target_index):
+            tasks[i]["status"] = "completed"
+        done = max(done, target_index)
+
+        task = tasks[target_index]
+        if complete:
+            task["status"] = "completed"
+            done = max(done, target_index + 1)
+            next_index = target_index + 1
+            if next_index < base_count and tasks[next_index]["status"] == "pending":
+                self._start_task(stage, next_index)
+        elif task["status"] != "completed":
+            self._start_task(stage, target_index)
+        stage["_base_done"] = done
 
     def _add_creation_task(self, stage: Dict, line: str) -> None:
         tasks = stage.get("tasks", [])
@@ -828,32 +1364,20 @@ class DeploymentRunner:
         )
 
         # Complete any currently running creation task
-        for task in tasks[base_count:]:
-            if task["status"] == "running":
-                task["status"] = "completed"
+        self._finish_running_tasks(stage, "completed", start=base_count)
 
-        label = line.split("Creating", 1)[-1].strip(" .:")
+        label = line.partition("Creating")[2].strip(" .:")
         if not label:
             label = "resource"
-        base_label = f"Creating {label}"
-        existing = [
-            task["label"]
-            for task in tasks[base_count:]
-            if task["label"].startswith(base_label)
-        ]
-        if base_label in existing:
-            suffix = sum(1 for task in existing if task.startswith(base_label))
-            task_label = f"{base_label} ({suffix + 1})"
-        else:
-            task_label = base_label
-        tasks.append({"label": task_label, "status": "running"})
+        task_label = self._unique_label(stage, f"Creating {label}")
+        self._append_running_task(stage, task_label)
 
     def _complete_dynamic_tasks(self, stage: Dict) -> None:
-        tasks = stage.get("tasks", [])
-        base_count = stage.get("base_task_count", len(tasks))
-        for task in tasks[base_count:]:
-            if task["status"] in {"pending", "running"}:
-                task["status"] = "completed"
+        # Dynamic tasks are appended as running and never pending, so only
+        # the tracked running indices need visiting
+        self._finish_running_tasks(
+            stage, "completed", start=stage["base_task_count"]
+        )
 
     def _advance_destroy_task(self, stage: Dict, line: str | None) -> None:
         if not line:
@@ -862,22 +1386,15 @@ class DeploymentRunner:
         if not tasks:
             return
 
-        line_lower = line.lower()
-        for idx, config in enumerate(DESTROY_TASK_SEQUENCE):
-            keywords = config.get("keywords", [])
-            complete_keywords = config.get("complete_keywords", [])
-
-            if any(keyword.lower() in line_lower for keyword in keywords):
-                self._ensure_base_task_progress(
-                    stage, idx, complete=False, sequence=DESTROY_TASK_SEQUENCE
-                )
-
-            if any(keyword.lower() in line_lower for keyword in complete_keywords):
-                self._ensure_base_task_progress(
-                    stage, idx, complete=True, sequence=DESTROY_TASK_SEQUENCE
-                )
-                if config["label"] == "Destroy VM resources":
-                    self._complete_destroy_dynamic_tasks(stage)
+        steps = {step for _, step in DESTROY_PROGRESS_SCANNER.scan(line.lower())}
+        # Apply every hit in sequence order, starts before completions
+        for idx, complete in sorted(steps):
+            self._ensure_base_task_progress(
+                stage, idx, complete=complete, sequence=DESTROY_TASK_SEQUENCE
+            )
+            label = DESTROY_TASK_SEQUENCE[idx]["label"]
+            if complete and label == "Destroy VM resources":
+                self._complete_destroy_dynamic_tasks(stage)
 
         if "Destroying..." in line:
             self._add_destroy_task(stage, line)
@@ -897,42 +1414,33 @@ class DeploymentRunner:
             sequence=DESTROY_TASK_SEQUENCE,
         )
 
-        for task in tasks[base_count:]:
-            if task["status"] == "running":
-                task["status"] = "completed"
+        self._finish_running_tasks(stage, "completed", start=base_count)
 
-        if ": Destroying" in line:
-            resource = line.split(": Destroying", 1)[0].strip()
-        else:
-            resource = line.strip().split()[0]
-        base_label = f"Destroying {resource}"
-        existing = [
-            task["label"]
-            for task in tasks[base_count:]
-            if task["label"].startswith(base_label)
-        ]
-        if base_label in existing:
-            suffix = sum(1 for task in existing if task.startswith(base_label))
-            label = f"{base_label} ({suffix + 1})"
+        resource, found, _ = line.partition(": Destroying")
+        if found:
+            resource = resource.strip()
         else:
-            label = base_label
-        tasks.append({"label": label, "status": "running"})
+            # First whitespace-delimited token
+            resource = line.split(None, 1)[0]
+        label = self._unique_label(stage, f"Destroying {resource}")
+        self._append_running_task(stage, label)
+        bisect.insort(stage["_destroy_labels"], (label, len(tasks) - 1))
 
     def _complete_matching_destroy_task(self, stage: Dict, line: str) -> None:
         tasks = stage.get("tasks", [])
-        base_count = stage.get("base_task_count", len(tasks))
-        resource = line.split(":")[0].strip()
+        resource = line.partition(":")[0].strip()
         prefix = f"Destroying {resource}"
-        for task in tasks[base_count:]:
-            if task["label"].startswith(prefix):
-                task["status"] = "completed"
+        # Labels starting with prefix sort contiguously from its position
+        labels = stage["_destroy_labels"]
+        position = bisect.bisect_left(labels, (prefix,))
+        while position < len(labels) and labels[position][0].startswith(prefix):
+            tasks[labels[position][1]]["status"] = "completed"
+            position += 1
 
     def _complete_destroy_dynamic_tasks(self, stage: Dict) -> None:
-        tasks = stage.get("tasks", [])
-        base_count = stage.get("base_task_count", len(tasks))
-        for task in tasks[base_count:]:
-            if task["status"] in {"pending", "running"}:
-                task["status"] = "completed"
+        self._finish_running_tasks(
+            stage, "completed", start=stage["base_task_count"]
+        )
 
     def _mark_tasks(self, stage: Dict, action: str) -> None:
         tasks = stage.get("tasks", [])
@@ -940,30 +1448,72 @@ class DeploymentRunner:
             return
 
         if action == "start":
-            for task in tasks:
-                if task["status"] == "pending":
-                    task["status"] = "running"
-                    break
+            next_index = self._next_pending(stage)
+            if next_index is not None:
+                self._start_task(stage, next_index)
             return
 
         if action == "complete":
-            for task in tasks:
-                if task["status"] in {"pending", "running"}:
-                    task["status"] = "completed"
+            self._finish_running_tasks(stage, "completed")
+            self._finish_pending_tasks(stage, "completed")
             return
 
         if action == "fail":
-            for task in tasks:
-                if task["status"] == "running":
-                    task["status"] = "failed"
-                elif task["status"] == "pending":
-                    task["status"] = "skipped"
+            self._finish_running_tasks(stage, "failed")
+            self._finish_pending_tasks(stage, "skipped")
             return
 
         if action == "skip":
-            for task in tasks:
-                if task["status"] == "pending":
-                    task["status"] = "skipped"
+            self._finish_pending_tasks(stage, "skipped")
+
+    # Task status bookkeeping: every transition to "running" goes through
+    # _start_task/_append_running_task so stage["_running"] stays complete.
+    def _start_task(self, stage: Dict, index: int) -> None:
+        task = stage["tasks"][index]
+        if task["status"] != "running":
+            task["status"] = "running"
+            stage["_running"].append(index)
+
+    def _append_running_task(self, stage: Dict, label: str) -> None:
+        tasks = stage["tasks"]
+        tasks.append({"label": label, "status": "running"})
+        stage["_running"].append(len(tasks) - 1)
+
+    def _finish_running_tasks(self, stage: Dict, status: str, start: int = 0) -> None:
+        """Move running tasks at index >= start to status."""
+        running = stage["_running"]
+        if not running:
+            return
+        tasks = stage["tasks"]
+        still_running = []
+        for index in running:
+            if tasks[index]["status"] != "running":
+                continue
+            if index >= start:
+                tasks[index]["status"] = status
+            else:
+                still_running.append(index)
+        stage["_running"] = still_running
+
+    def _next_pending(self, stage: Dict, start: int = 0) -> int | None:
+        """Return the index of the first pending task at or after start."""
+        tasks = stage["tasks"]
+        first_pending = stage["_first_pending"]
+        for index in range(max(start, first_pending), stage["base_task_count"]):
+            if tasks[index]["status"] == "pending":
+                if start <= first_pending:
+                    stage["_first_pending"] = index
+                return index
+        if start <= first_pending:
+            stage["_first_pending"] = stage["base_task_count"]
+        return None
+
+    def _finish_pending_tasks(self, stage: Dict, status: str) -> None:
+        tasks = stage["tasks"]
+        for index in range(stage["_first_pending"], stage["base_task_count"]):
+            if tasks[index]["status"] == "pending":
+                tasks[index]["status"] = status
+        stage["_first_pending"] = stage["base_task_count"]
 
 
 runner = DeploymentRunner()
@@ -978,7 +1528,8 @@ def index():
 
 @app.route("/api/status")
 def get_status():
-    return jsonify(runner.status_snapshot())
+    since_seq = request.args.get("since", type=int)
+    return Response(runner.status_json(since_seq), mimetype="application/json")
 
 
 @app.route("/api/run", methods=["POST"])
@@ -1025,19 +1576,23 @@ def vm_metrics():
         return jsonify({"available": False, "message": message}), 503
 
     try:
-        stats = client.cluster.resources.get(type="vm")
+        stats = get_cluster_vm_stats(client)
     except Exception:
+        # get_cluster_vm_stats already dropped the client, so the next poll
+        # logs in again
         return jsonify({"available": False, "message": "Unable to reach Proxmox API."}), 502
 
+    # Inventory ids are already strings (see get_tfstate_vm_info), so only
+    # the integer vmids reported by Proxmox need converting
     stats_by_id = {
-        str(entry.get("vmid")): entry
+        str(entry["vmid"]): entry
         for entry in stats
         if entry.get("vmid") is not None
     }
 
     enriched = []
     for vm in vms:
-        vm_stat = stats_by_id.get(str(vm["id"]))
+        vm_stat = stats_by_id.get(vm["id"])
         if not vm_stat:
             enriched.append({**vm, "cpu_pct": None, "mem": None, "online": False})
             continue
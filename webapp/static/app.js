@@ -11,6 +11,8 @@ const themeToggle = document.getElementById("themeToggle");
 let vmInventory = [];
 let metricsTimer = null;
 let currentTheme = null;
+let logLines = [];
+let logSeq = null;
 
 const STATUS_LABELS = {
   pending: "Pending",
@@ -30,13 +32,14 @@ const TASK_ICONS = {
 
 async function requestStatus() {
   try {
-    const response = await fetch("/api/status");
+    const query = logSeq === null ? "" : `?since=${logSeq}`;
+    const response = await fetch(`/api/status${query}`);
     if (!response.ok) {
       throw new Error("Request failed");
     }
     const payload = await response.json();
     renderStages(payload.stages || []);
-    renderLogs(payload.logs || []);
+    updateLogs(payload);
     toggleControls(payload.running, payload.mode || "deploy");
   } catch (err) {
     runStatus.textContent = "Connection error";
@@ -134,6 +137,17 @@ function renderStages(stages) {
   });
 }
 
+function updateLogs(payload) {
+  const logs = payload.logs || [];
+  if (payload.logs_complete !== false) {
+    logLines = logs;
+  } else if (logs.length) {
+    logLines = logLines.concat(logs).slice(-100);
+  }
+  logSeq = typeof payload.log_seq === "number" ? payload.log_seq : null;
+  renderLogs(logLines);
+}
+
 function renderLogs(logs) {
   logOutput.textContent = logs.length
     ? logs.slice(-100).join("\n")